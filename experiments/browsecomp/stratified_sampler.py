@@ -1,20 +1,74 @@
 import json
-import pandas as pd
 import requests
 import csv
-import base64
+import binascii
 import hashlib
 import random
-from typing import List, Dict, Any
-from io import StringIO
-from tqdm import tqdm
+from typing import List, Dict, Any, Optional, Tuple
+from io import StringIO, TextIOWrapper
 from collections import defaultdict
+from operator import itemgetter
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # save_sample falls back to the stdlib json encoder
+    orjson = None
+
+try:
+    import numpy as np
+except ImportError:  # decrypt falls back to pure-Python bignum XOR
+    np = None
+
+
+@lru_cache(maxsize=None)
+def _password_digest(password):
+    """SHA256 digest of the password, computed once per process."""
+    return hashlib.sha256(password.encode()).digest()
+
+
+def derive_key(password, length):
+    """Derive a fixed-length key from the password using SHA256."""
+    key = _password_digest(password)
+    return key * (length // len(key)) + key[: length % len(key)]
+
+
+@lru_cache(maxsize=None)
+def _password_key_array(password):
+    """SHA256 digest of the password as a read-only uint8 array."""
+    return np.frombuffer(_password_digest(password), dtype=np.uint8)
+
+
+def decrypt(ciphertext_b64, password):
+    """Decrypt base64-encoded ciphertext with XOR."""
+    encrypted = binascii.a2b_base64(ciphertext_b64)
+    n = len(encrypted)
+    if np is None:
+        # CPython XORs big integers a machine word at a time
+        key = derive_key(password, n)
+        return (int.from_bytes(encrypted, "big") ^ int.from_bytes(key, "big")).to_bytes(n, "big").decode()
+    
+    key = _password_key_array(password)
+    encrypted = np.frombuffer(encrypted, dtype=np.uint8)
+    decrypted = np.empty(n, dtype=np.uint8)
+    # View the ciphertext as rows of one digest each so the digest broadcasts
+    # across them; the key is never tiled or copied
+    full = n - n % key.size
+    np.bitwise_xor(encrypted[:full].reshape(-1, key.size), key, out=decrypted[:full].reshape(-1, key.size))
+    np.bitwise_xor(encrypted[full:], key[:n - full], out=decrypted[full:])
+    return decrypted.tobytes().decode()
+
 
 class BrowseCompStratifiedSampler:
-    def __init__(self):
+    def __init__(self, seed: int = 60):
         """
         Initialize the sampler for BrowseComp questions using existing topic categories
+        
+        Args:
+            seed: Seed for the sampler's private random generator, for reproducibility
         """
+        self.rng = random.Random(seed)
+        
         self.target_proportions = {
             "TV shows & movies": 205,
             "Other": 197,
@@ -40,22 +94,91 @@ class BrowseCompStratifiedSampler:
             # Adjust the largest category
             largest_cat = max(self.sample_proportions.keys(), key=lambda k: self.sample_proportions[k])
             self.sample_proportions[largest_cat] += (60 - current_total)
+        
+        # Integer ids for the known categories. Rows are tagged with these ids once
+        # at load time, so per-category counts and sampling pools are plain lists
+        # indexed by id
+        self.categories = list(self.target_proportions)
+        self.cat_to_id = {name: i for i, name in enumerate(self.categories)}
     
     def derive_key(self, password, length):
         """Derive a fixed-length key from the password using SHA256."""
-        hasher = hashlib.sha256()
-        hasher.update(password.encode())
-        key = hasher.digest()
-        return key * (length // len(key)) + key[: length % len(key)]
+        return derive_key(password, length)
 
     def decrypt(self, ciphertext_b64, password):
         """Decrypt base64-encoded ciphertext with XOR."""
-        encrypted = base64.b64decode(ciphertext_b64)
-        key = self.derive_key(password, len(encrypted))
-        decrypted = bytes(a ^ b for a, b in zip(encrypted, key))
-        return decrypted.decode()
+        return decrypt(ciphertext_b64, password)
     
-    def load_browsecomp_dataset(self, dataset_url: str) -> List[Dict[str, Any]]:
+    def _select_questions(self, topics, cat_ids, encrypted_rows, errors):
+        """
+        Draw and decrypt each category's target rows, then the rows that top up
+        short categories
+        
+        Only the plaintext topic is needed to decide which rows end up in the
+        sample, so rows are drawn first and only those are decrypted. A drawn row
+        that fails to decrypt is replaced by a random unused row from the same
+        pool until the target is met or the pool runs out. Without failures the
+        rng calls match sampling the fully decrypted dataset, so a seed always
+        picks the same rows in the same order.
+        
+        Returns:
+            Tuple of (questions for each category, indexed by cat_to_id id;
+            questions that top up short categories)
+        """
+        tried = set()
+        
+        def draw(pool, count):
+            picks = self.rng.sample(pool, count) if len(pool) >= count else list(pool)
+            tried.update(picks)
+            spare = [i for i in pool if i not in tried]
+            questions = []
+            k = 0
+            while k < len(picks):
+                i = picks[k]
+                k += 1
+                problem_b64, answer_b64, canary = encrypted_rows[i]
+                try:
+                    questions.append({
+                        "index": i,
+                        "question": decrypt(problem_b64, canary),
+                        "answer": decrypt(answer_b64, canary),
+                        "category": topics[i]
+                    })
+                except Exception as e:
+                    errors.append((i, e))
+                    if spare:
+                        replacement = spare.pop(self.rng.randrange(len(spare)))
+                        tried.add(replacement)
+                        picks.append(replacement)
+            return questions
+        
+        # Skip the first 60 questions (index 0-59) to avoid training set questions
+        pools = [[] for _ in self.categories]
+        for i in range(60, len(cat_ids)):
+            if cat_ids[i] is not None and encrypted_rows[i] is not None:
+                pools[cat_ids[i]].append(i)
+        
+        categorized_questions = [[] for _ in self.categories]
+        for category, target_count in self.sample_proportions.items():
+            cat_id = self.cat_to_id[category]
+            categorized_questions[cat_id] = draw(pools[cat_id], target_count)
+        
+        # If categories are short, draw the shortfall from the remaining rows
+        fill_questions = []
+        remaining_needed = 60 - sum(len(questions) for questions in categorized_questions)
+        if remaining_needed > 0:
+            unused = [
+                i for i in range(60, len(cat_ids))
+                if i not in tried and encrypted_rows[i] is not None
+            ]
+            if len(unused) >= remaining_needed:
+                fill_questions = draw(unused, remaining_needed)
+        
+        return categorized_questions, fill_questions
+    
+    def load_browsecomp_dataset(
+        self, dataset_url: str
+    ) -> Tuple[List[List[Dict[str, Any]]], List[Dict[str, Any]]]:
         """
         Load BrowseComp questions from the official dataset URL with decryption
         
@@ -63,72 +186,117 @@ class BrowseCompStratifiedSampler:
             dataset_url: URL to the BrowseComp CSV dataset
             
         Returns:
-            List of questions with categories from the dataset
+            Tuple of (questions drawn for each category, indexed by cat_to_id id;
+            questions drawn to top up short categories). Questions 0-59 are never
+            included
         """
         try:
             print(f"Downloading BrowseComp dataset from: {dataset_url}")
-            df = pd.read_csv(dataset_url)
+            # Stream rows straight off the download; only the encrypted fields (as
+            # plain strings), the topic and its category id are kept. Topics outside
+            # the known categories have no id and are only counted for the printout
+            topics = []
+            cat_ids = []
+            encrypted_rows = []
+            category_counts = [0] * len(self.categories)
+            other_counts = defaultdict(int)
+            errors = []
+            with requests.get(dataset_url, stream=True) as response:
+                response.raise_for_status()
+                response.raw.decode_content = True
+                # Plain csv.reader rows plus fixed column positions avoid building a
+                # dict per row; only the four columns used below are kept. The reader
+                # gets a real text stream so quoted fields may contain newlines, and
+                # utf-8-sig drops a leading byte-order mark from the header
+                reader = csv.reader(TextIOWrapper(response.raw, encoding="utf-8-sig", newline=""))
+                fieldnames = next(reader, [])
+                required = ("problem", "answer", "canary", "problem_topic")
+                missing = [name for name in required if name not in fieldnames]
+                if missing:
+                    raise ValueError(f"Dataset is missing required columns: {', '.join(missing)}")
+                problem_col, answer_col, canary_col, topic_col = (fieldnames.index(name) for name in required)
+                for row in reader:
+                    if not row:
+                        continue
+                    # Treat cells missing from a short row as empty
+                    if len(row) < len(fieldnames):
+                        row += [""] * (len(fieldnames) - len(row))
+                    topic = row[topic_col] or "Other"
+                    cat_id = self.cat_to_id.get(topic)
+                    if cat_id is None:
+                        other_counts[topic] += 1
+                    else:
+                        category_counts[cat_id] += 1
+                    topics.append(topic)
+                    cat_ids.append(cat_id)
+                    # Rows without a problem or canary cannot be decrypted and are never
+                    # sampled; a missing answer decrypts to an empty string
+                    if not row[problem_col] or not row[canary_col]:
+                        errors.append((len(encrypted_rows), "missing problem or canary"))
+                        encrypted_rows.append(None)
+                        continue
+                    encrypted_rows.append((row[problem_col], row[answer_col], row[canary_col]))
             
             print(f"Dataset loaded successfully!")
-            print(f"   - Total rows: {len(df)}")
-            print(f"   - Columns: {list(df.columns)}")
-            
-            questions_with_categories = []
-            print("Decrypting questions...")
+            print(f"   - Total rows: {len(cat_ids)}")
+            print(f"   - Columns: {fieldnames}")
             
-            for i, row in tqdm(df.iterrows(), total=len(df), desc="Processing"):
-                try:
-                    canary = row.get("canary", "")
-                    problem = self.decrypt(row.get("problem", ""), canary)
-                    answer = self.decrypt(row.get("answer", ""), canary) if pd.notna(row.get("answer", "")) else ""
-                    problem_topic = row.get("problem_topic", "Other") 
-                    
-                    questions_with_categories.append({
-                        "index": i,
-                        "question": problem,
-                        "answer": answer,
-                        "category": problem_topic
-                    })
-                    
-                except Exception as e:
-                    print(f"Error processing row {i}: {e}")
+            counts = dict(zip(self.categories, category_counts))
+            counts.update(other_counts)
+            print(f"\nDataset Category Distribution:")
+            for category, count in sorted(counts.items()):
+                if count == 0:
                     continue
+                target = self.target_proportions.get(category, 0)
+                print(f"   {category}: {count} questions (expected: {target})")
             
-            print(f"Successfully processed {len(questions_with_categories)} questions")
+            print(f"Decrypting sampled questions...")
+            categorized_questions, fill_questions = self._select_questions(topics, cat_ids, encrypted_rows, errors)
             
-            category_counts = defaultdict(int)
-            for q in questions_with_categories:
-                category_counts[q['category']] += 1
+            if errors:
+                print(f"Failed to process {len(errors)} rows:")
+                for i, error in errors:
+                    print(f"   Row {i}: {error}")
             
-            print(f"\nDataset Category Distribution:")
-            for category in sorted(category_counts.keys()):
-                count = category_counts[category]
-                target = self.target_proportions.get(category, 0)
-                print(f"   {category}: {count} questions (expected: {target})")
+            processed = sum(len(questions) for questions in categorized_questions) + len(fill_questions)
+            print(f"Successfully processed {processed} questions")
             
-            return questions_with_categories
+            return categorized_questions, fill_questions
             
         except requests.RequestException as e:
             print(f"Error downloading dataset: {e}")
             raise
-        except pd.errors.ParserError as e:
+        except csv.Error as e:
             print(f"Error parsing CSV: {e}")
             raise
         except Exception as e:
             print(f" Unexpected error loading dataset: {e}")
             raise
     
-    def create_stratified_sample(self, questions_with_categories: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def create_stratified_sample(
+        self,
+        categorized_questions: List[List[Dict[str, Any]]],
+        fill_questions: Optional[List[Dict[str, Any]]] = None,
+    ) -> List[Dict[str, Any]]:
         """
-        Create a stratified random sample maintaining original proportions
-        """
-        # Filter out the first 60 questions (index 0-59) to avoid training set questions
-        filtered_questions = [q for q in questions_with_categories if q['index'] > 59]
+        Assemble the stratified sample from the questions drawn at load time and
+        shuffle it
+        
+        Takes the two lists returned by load_browsecomp_dataset, not a flat list
+        of questions.
         
-        # Group questions by category
-        categorized_questions = defaultdict(list)
-        for q in filtered_questions:
-            categorized_questions[q['category']].append(q)
+        Args:
+            categorized_questions: One list of questions per category id (see
+                cat_to_id); training set questions already excluded
+            fill_questions: Questions used to top up the sample if categories are short
+        """
+        if len(categorized_questions) != len(self.categories) or not all(
+            isinstance(questions, list) for questions in categorized_questions
+        ):
+            raise TypeError(
+                "categorized_questions must hold one list of questions per category id, "
+                "as returned by load_browsecomp_dataset"
+            )
         
         print(f"\nCreating stratified sample of 60 questions...")
         print(f"Target distribution:")
@@ -136,37 +304,29 @@ class BrowseCompStratifiedSampler:
         sample = []
         
         for category, target_count in self.sample_proportions.items():
-            available_questions = categorized_questions.get(category, [])
+            available_questions = categorized_questions[self.cat_to_id[category]]
             
             if len(available_questions) == 0:
                 print(f"   {category}: {target_count} needed, 0 available - SKIPPING")
                 continue
             
-            # Sample randomly from this category
-            if len(available_questions) >= target_count:
-                sampled = random.sample(available_questions, target_count)
-            else:
-                sampled = available_questions
+            if len(available_questions) < target_count:
                 print(f"   {category}: {target_count} needed, only {len(available_questions)} available")
             
-            sample.extend(sampled)
-            print(f"   {category}: {len(sampled)} questions selected")
+            sample.extend(available_questions)
+            print(f"   {category}: {len(available_questions)} questions selected")
         
-        # If we still need more questions to reach 60, fill from "Other" or largest categories
+        # If we still need more questions to reach 60, add the top-up questions
         if len(sample) < 60:
             remaining_needed = 60 - len(sample)
             print(f"\n Need {remaining_needed} more questions to reach 60...")
             
-            used_indices = set(q['index'] for q in sample)
-            unused_questions = [q for q in filtered_questions if q['index'] not in used_indices]
-            
-            if len(unused_questions) >= remaining_needed:
-                additional = random.sample(unused_questions, remaining_needed)
-                sample.extend(additional)
-                print(f"   Added {len(additional)} additional random questions")
+            if fill_questions:
+                sample.extend(fill_questions)
+                print(f"   Added {len(fill_questions)} additional random questions")
         
         # Shuffle the final sample
-        random.shuffle(sample)
+        self.rng.shuffle(sample)
         
         print(f"\nSample created: {len(sample)} questions total")
         
@@ -185,39 +345,44 @@ class BrowseCompStratifiedSampler:
         csv_filename = f"{base_filename}.csv"
         with open(csv_filename, 'w', newline='', encoding='utf-8') as f:
             fieldnames = ['rank', 'index', 'question', 'answer', 'category']
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            for q in sample:
-                writer.writerow(q)
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            writer.writerows(map(itemgetter(*fieldnames), sample))
         
         # Save to JSON
         json_filename = f"{base_filename}.json"
-        with open(json_filename, 'w', encoding='utf-8') as f:
-            json.dump(sample, f, indent=2, ensure_ascii=False)
+        if orjson is not None:
+            with open(json_filename, 'wb') as f:
+                f.write(orjson.dumps(sample, option=orjson.OPT_INDENT_2))
+        else:
+            with open(json_filename, 'w', encoding='utf-8') as f:
+                json.dump(sample, f, indent=2, ensure_ascii=False)
         
         # Save to TXT (human readable)
         txt_filename = f"{base_filename}.txt"
+        # Questions and category summary in one pass; the body is buffered so
+        # the summary can be written ahead of it
+        category_counts = defaultdict(int)
+        body = StringIO()
+        for q in sample:
+            category_counts[q['category']] += 1
+            body.write(f"Rank {q['rank']:2d} | Category: {q['category']}\n")
+            body.write(f"Question: {q['question']}\n")
+            body.write(f"Answer: {q['answer']}\n")
+            body.write("-" * 70 + "\n\n")
+        
+        header = [
+            "BrowseComp: Stratified Random Sample (60 Questions)\n",
+            "Maintaining Original Category Proportions\n",
+            "=" * 70 + "\n\n",
+            "Category Distribution:\n",
+        ]
+        for category, count in sorted(category_counts.items()):
+            header.append(f"  {category}: {count} questions\n")
+        header.append("\n" + "=" * 70 + "\n\n")
+        
         with open(txt_filename, 'w', encoding='utf-8') as f:
-            f.write("BrowseComp: Stratified Random Sample (60 Questions)\n")
-            f.write("Maintaining Original Category Proportions\n")
-            f.write("=" * 70 + "\n\n")
-            
-            # Category summary
-            category_counts = defaultdict(int)
-            for q in sample:
-                category_counts[q['category']] += 1
-            
-            f.write("Category Distribution:\n")
-            for category, count in sorted(category_counts.items()):
-                f.write(f"  {category}: {count} questions\n")
-            f.write("\n" + "=" * 70 + "\n\n")
-            
-            # Questions
-            for q in sample:
-                f.write(f"Rank {q['rank']:2d} | Category: {q['category']}\n")
-                f.write(f"Question: {q['question']}\n")
-                f.write(f"Answer: {q['answer']}\n")
-                f.write("-" * 70 + "\n\n")
+            f.write("".join(header) + body.getvalue())
         
         print(f"\nFiles created:")
         print(f"   {csv_filename} - CSV format")
@@ -238,20 +403,17 @@ def create_stratified_browsecomp_sample():
     print("Using existing problem_topic column for categorization")
     print("=" * 65)
     
-    # Set random seed for reproducibility 
-    random.seed(60)
-    
     try:
-        # Initialize sampler
-        sampler = BrowseCompStratifiedSampler()
+        # Initialize sampler with a fixed seed for reproducibility
+        sampler = BrowseCompStratifiedSampler(seed=60)
         
         print("Target sample distribution (60 questions total):")
         for category, count in sampler.sample_proportions.items():
             print(f"   {category}: {count} questions")
         
-        questions_with_categories = sampler.load_browsecomp_dataset(DATASET_URL)
+        categorized_questions, fill_questions = sampler.load_browsecomp_dataset(DATASET_URL)
         
-        sample = sampler.create_stratified_sample(questions_with_categories)
+        sample = sampler.create_stratified_sample(categorized_questions, fill_questions)
         
         csv_file, json_file, txt_file = sampler.save_sample(sample)
         